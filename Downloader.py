@@ -1,17 +1,98 @@
+import atexit
+import json
 import locale
+import logging
 import math
 import os
-import re
+import shutil
+import subprocess
+import tempfile
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
-from dataclasses import dataclass, field
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, asdict
+from functools import lru_cache
+from itertools import chain
 from typing import List, Dict, Optional, Callable
+from urllib.parse import urlsplit
 
 import i18n
 import requests
 import yaml
 from peewee import SqliteDatabase, Model, CharField
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from tqdm.contrib.logging import logging_redirect_tqdm
+from urllib3.util import Retry
+
+# Prefer the libyaml bindings; fall back to the pure-Python classes when PyYAML was built without them
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+
+# orjson is much faster when installed; both variants read and write UTF-8 bytes
+try:
+    from orjson import loads as json_loads, dumps as json_dumps
+except ImportError:
+    from json import loads as json_loads
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+logger = logging.getLogger(__name__)
+
+# Control characters (which also include newlines) are never useful in a name
+_CONTROL_CHARS = [chr(c) for c in range(32)] + ['\x7f']
+# Characters that are invalid in file names are dropped and spaces become underscores
+_FILENAME_TRANS = str.maketrans({**{c: None for c in '\\/*?"<>|'}, **dict.fromkeys(_CONTROL_CHARS), ' ': '_'})
+# Path separators and control characters in profile names/IDs become underscores so they stay a single directory
+_PATH_TRANS = str.maketrans({'/': '_', '\\': '_', **dict.fromkeys(_CONTROL_CHARS, '_')})
+
+
+class RateLimiter:
+    """
+    Sliding-window limiter allowing at most `rate` requests per second to each host (0 disables it).
+    """
+    def __init__(self, rate: int):
+        self.rate = rate
+        self._hosts: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str):
+        """
+        Block until another request to the URL's host fits in the window.
+        """
+        if self.rate <= 0:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = (threading.Lock(), deque(maxlen=self.rate))
+            host_lock, window = self._hosts[host]
+        with host_lock:
+            if len(window) == self.rate:
+                delay = 1.0 - (time.monotonic() - window[0])
+                if delay > 0:
+                    time.sleep(delay)
+            window.append(time.monotonic())
+
+
+class RateLimitedSession(requests.Session):
+    """
+    A requests session that waits on a RateLimiter before every request
+    and applies a default (connect, read) timeout.
+    """
+    def __init__(self, rate_limiter: RateLimiter, timeout=None):
+        super().__init__()
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+
+    def request(self, method, url, *args, **kwargs):
+        self.rate_limiter.wait(url)
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, *args, **kwargs)
 
 
 @dataclass
@@ -24,6 +105,21 @@ class Config:
     process_from_oldest: bool = field(default=False)
     get_empty_posts: bool = field(default=False)
     debug_verify_ssl: bool = field(default=True)
+    download_workers: int = field(default=8)
+    fetch_workers: int = field(default=8)
+    max_rps: int = field(default=0)
+    use_aria2c: bool = field(default=False)
+    inter_post_delay: float = field(default=0.0)
+
+    def __post_init__(self):
+        self._proxies = self._build_proxies()
+        self._rate_limiter = RateLimiter(self.max_rps)  # Shared by every session this config creates
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        # Keep the cached proxy dict in sync if proxy settings change after construction
+        if name.startswith("proxy_") and "_proxies" in self.__dict__:
+            super().__setattr__("_proxies", self._build_proxies())
 
     @classmethod
     def from_yaml(cls, file_path: str) -> "Config":
@@ -31,8 +127,14 @@ class Config:
         Load configuration from a YAML file and return a Config instance.
         """
         try:
-            with open(file_path, 'r') as file:
-                data = yaml.safe_load(file) or {}
+            path = os.path.abspath(file_path)
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            data = cls._read_sidecar(path, signature)
+            if data is None:
+                with open(path, 'r') as file:
+                    data = yaml.load(file, Loader=YamlLoader) or {}
+                cls._write_sidecar(path, signature, data)
             return cls(**data)
         except FileNotFoundError:
             print(i18n.t("file_not_found", file_path=file_path))
@@ -45,12 +147,50 @@ class Config:
         Save the current configuration to a YAML file.
         """
         try:
+            data = asdict(self)
             with open(file_path, 'w') as file:
-                yaml.dump(vars(self), file, default_flow_style=False)
+                yaml.dump(data, file, Dumper=YamlDumper, default_flow_style=False)
+            # Write-through: we know exactly what the file now holds, so the next start skips the YAML parse
+            path = os.path.abspath(file_path)
+            stat = os.stat(path)
+            self._write_sidecar(path, (stat.st_mtime_ns, stat.st_size), data)
             print(i18n.t("config_saved", file_path=file_path))
         except Exception as e:
             print(f"{i18n.t('error_saving_config', file_path=file_path)}: {e}")
 
+    @staticmethod
+    def _read_sidecar(path: str, signature: tuple) -> Optional[dict]:
+        """
+        Return the JSON copy of a YAML config if it was written for the file's current mtime and size.
+        """
+        try:
+            with open(path + '.cache.json', 'rb') as file:
+                sidecar = json_loads(file.read())
+        except (OSError, ValueError):
+            return None
+        if tuple(sidecar.get('signature', ())) != signature:
+            return None
+        return sidecar.get('data')
+
+    @staticmethod
+    def _write_sidecar(path: str, signature: tuple, data: dict):
+        """
+        Store a JSON copy of a parsed YAML config next to it; JSON reloads much faster than YAML.
+        Configs that JSON can't round-trip exactly (e.g. YAML dates) or that hold a proxy
+        password get no sidecar: the password should live in one file only.
+        """
+        sidecar_path = path + '.cache.json'
+        plain = all(value is None or type(value) in (str, int, float, bool) for value in data.values())
+        try:
+            if not plain or data.get('proxy_password'):
+                if os.path.exists(sidecar_path):
+                    os.remove(sidecar_path)
+                return
+            with open(sidecar_path, 'wb') as file:
+                file.write(json_dumps({'signature': list(signature), 'data': data}))
+        except (OSError, TypeError, ValueError):
+            pass  # The sidecar is only an optimization
+
     def __str__(self):
         masked_password = '*' * len(self.proxy_password) if self.proxy_password else None
         return (f"Config("
@@ -61,12 +201,23 @@ class Config:
                 f"post_info={self.post_info}, "
                 f"process_from_oldest={self.process_from_oldest}, "
                 f"get_empty_posts={self.get_empty_posts}, "
-                f"debug_verify_ssl={self.debug_verify_ssl})")
+                f"debug_verify_ssl={self.debug_verify_ssl}, "
+                f"download_workers={self.download_workers}, "
+                f"fetch_workers={self.fetch_workers}, "
+                f"max_rps={self.max_rps}, "
+                f"use_aria2c={self.use_aria2c}, "
+                f"inter_post_delay={self.inter_post_delay})")
 
     def get_requests_proxy(self):
         """
         Get a dictionary of proxies for requests.
         """
+        return self._proxies
+
+    def _build_proxies(self):
+        """
+        Build the proxies dictionary from the proxy settings.
+        """
         if self.proxy_url and self.proxy_url.strip():
             if self.proxy_username and self.proxy_password:
                 auth = f"{self.proxy_username}:{self.proxy_password}@"
@@ -78,10 +229,34 @@ class Config:
             }
         return None
 
+    def create_session(self) -> requests.Session:
+        """
+        Create a requests session with keep-alive connection pooling and transport-level retries.
+        Throttling responses (429/503) are retried after the server's Retry-After delay.
+        Requests time out instead of hanging forever on a stalled connection.
+        """
+        retry = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=["GET", "HEAD"])
+        # Keep at least one pooled connection per worker thread, or urllib3 discards the extras
+        pool_size = max(32, self.download_workers, self.fetch_workers)
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool_size, max_retries=retry)
+        # 10s to connect, 60s between reads: the read timeout is per socket read, so big files are fine
+        session = RateLimitedSession(self._rate_limiter, timeout=(10, 60))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
 
 class Posts:
     def __init__(self, config: Config):
         self.config: Config = config
+        self.session = config.create_session()
+
+    def close(self):
+        """
+        Close the pooled API connections.
+        """
+        self.session.close()
 
     @staticmethod
     def get_base_config(profile_url: str):
@@ -104,10 +279,7 @@ class Posts:
         """
         Determine if the value is an offset (up to 5 digits) or an ID.
         """
-        try:
-            return len(value) <= 5 and value.isdigit()
-        except ValueError:
-            return False
+        return value.isdigit() and int(value) < 100000
 
     def parse_fetch_mode(self, fetch_mode: str, total_count: int) -> List:
         """
@@ -143,9 +315,9 @@ class Posts:
         Fetch posts from the API.
         """
         url = f"{base_api_url}/{service}/user/{user_id}/posts-legacy?o={offset}"
-        response = requests.get(url, proxies=self.config.get_requests_proxy(), verify=self.config.debug_verify_ssl)
+        response = self.session.get(url, proxies=self.config.get_requests_proxy(), verify=self.config.debug_verify_ssl)
         response.raise_for_status()
-        return response.json()
+        return json_loads(response.content)
 
     @staticmethod
     def process_posts(posts: List[Dict], previews: List[Dict], attachments_data: List[Dict],
@@ -154,6 +326,11 @@ class Posts:
         """
         Process posts and organize file links.
         """
+        # Index file servers by path once per page; the first entry for a path wins
+        path_to_server = {}
+        for item in chain(previews, attachments_data):
+            path_to_server.setdefault(item["path"], item["server"])
+
         processed = []
         for post in posts:
             if id_filter and not id_filter(post['id']):
@@ -169,19 +346,22 @@ class Posts:
                 "offset": offset,
                 "files": []
             }
+            seen = set()  # The main file is often repeated among the attachments
 
-            all_data = previews + attachments_data
             if "file" in post and post["file"]:
-                file_data = next((item for item in all_data if item["path"] == post["file"]["path"]), None)
-                if file_data:
-                    file_url = f"{file_data['server']}/data{post['file']['path']}"
+                server = path_to_server.get(post["file"]["path"])
+                if server:
+                    file_url = f"{server}/data{post['file']['path']}"
+                    seen.add(file_url)
                     result["files"].append({"name": post["file"]["name"], "url": file_url})
 
             for attachment in post.get("attachments", []):
-                attachment_data = next((item for item in all_data if item["path"] == attachment["path"]), None)
-                if attachment_data:
-                    file_url = f"{attachment_data['server']}/data{attachment['path']}"
-                    result["files"].append({"name": attachment["name"], "url": file_url})
+                server = path_to_server.get(attachment["path"])
+                if server:
+                    file_url = f"{server}/data{attachment['path']}"
+                    if file_url not in seen:
+                        seen.add(file_url)
+                        result["files"].append({"name": attachment["name"], "url": file_url})
 
             if not save_empty_files and not result["files"]:
                 continue
@@ -195,7 +375,7 @@ class Posts:
         """
         Remove characters that could break directory or file creation.
         """
-        return value.replace("/", "_").replace("\\", "_")
+        return value.translate(_PATH_TRANS)
 
     def run(self, profile_url: str, fetch_mode: str):
         """
@@ -219,113 +399,377 @@ class Posts:
             return
 
         id_filter = None
+        target_id = None  # Set for a single-ID search, which can stop as soon as that post is seen
         if isinstance(offsets[0], str) and offsets[0].startswith("id:"):
             id_range = offsets[0].split(":")[1]
             if "-" in id_range:
-                id1, id2 = map(int, id_range.split("-"))
-                id_filter = lambda x: id1 <= int(x) <= id2
+                # A bounds check rather than a set: ID ranges can span millions of values.
+                # Sorting lets the range be given in either order.
+                # Some services (e.g. gumroad) have non-numeric post IDs, which can't be in a numeric range.
+                id1, id2 = sorted(map(int, id_range.split("-")))
+                # Pages are ordered by publish date, not ID, so a range always needs every page
+                id_filter = lambda x: x.isdigit() and id1 <= int(x) <= id2
             else:
-                id_filter = lambda x: x == int(id_range)
+                # Post IDs arrive as strings, so compare them as strings (minus any typed leading zeros)
+                target_id = id_range.lstrip("0") or id_range
+                id_filter = target_id.__eq__
             offsets = list(range(0, count, 50))
 
+        # Pages are independent, so fetch them concurrently; map() keeps them in offset order.
+        # Each page is processed as soon as it arrives so its raw JSON can be released.
         processed_posts = []
-        for offset in offsets:
-            page_number = (offset // 50) + 1
-            post_data = self.fetch_posts(base_api_url, service, user_id, offset)
-            processed_posts += self.process_posts(
-                posts=post_data["results"],
-                previews=[item for sublist in post_data.get("result_previews", []) for item in sublist],
-                attachments_data=[item for sublist in post_data.get("result_attachments", []) for item in sublist],
-                page_number=page_number,
-                offset=offset,
-                base_server=base_server,
-                save_empty_files=self.config.get_empty_posts,
-                id_filter=id_filter
-            )
+        with ThreadPoolExecutor(max_workers=max(1, min(self.config.fetch_workers, len(offsets)))) as executor:
+            pages = executor.map(lambda o: self.fetch_posts(base_api_url, service, user_id, o), offsets)
+            for offset, post_data in zip(offsets, pages):
+                page_number = (offset // 50) + 1
+                processed_posts += self.process_posts(
+                    posts=post_data["results"],
+                    previews=list(chain.from_iterable(post_data.get("result_previews") or ())),
+                    attachments_data=list(chain.from_iterable(post_data.get("result_attachments") or ())),
+                    page_number=page_number,
+                    offset=offset,
+                    base_server=base_server,
+                    save_empty_files=self.config.get_empty_posts,
+                    id_filter=id_filter
+                )
+
+                # Post IDs are unique, so once the wanted post has been seen no later page can hold it.
+                # Check the raw page: an empty post may have been dropped from the processed ones.
+                if target_id is not None and any(post["id"] == target_id for post in post_data["results"]):
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
 
         return base_dir, safe_service, safe_user_id, safe_name, processed_posts
 
 
 class Down:
+    # Downloaded post IDs are written in batches of this size; a crash loses at most one batch
+    FLUSH_EVERY = 50
+    # Files at least this large are fetched as parallel byte ranges when the server supports them
+    SEGMENT_THRESHOLD = 50 * 1024 * 1024
+    SEGMENTS = 4
+    # Posts handed to each aria2c run: enough files to keep its download queue full
+    ARIA2C_BATCH = 50
+
     def __init__(self, config: Config):
         """
         Initialize the downloader with a SQLite database and configuration.
         """
-        self.db = SqliteDatabase('downloaded.db')
+        # WAL + synchronous=NORMAL: no fsync per commit and readers don't block the writer
+        self.db = SqliteDatabase('downloaded.db', pragmas={
+            'journal_mode': 'wal',
+            'synchronous': 1,
+            'temp_store': 2,
+            'mmap_size': 268435456,
+            'cache_size': -64000,
+        })
         self.model = self.create_model()
         self.db.connect()
         self.db.create_tables([self.model])  # Ensure the table exists
+        self.migrate_database()
         self.config: Config = config
+        self.session = config.create_session()
+        self.db_lock = threading.Lock()  # Posts are downloaded from several threads
+        self._pending = []  # Downloaded post IDs not yet written to the database
+        # Every downloaded post ID, loaded once so skip checks never hit the database
+        self._known = {row.value for row in self.model.select(self.model.value)}
+        atexit.register(self.flush)  # Don't lose the last partial batch on exit
+        self.aria2c = shutil.which("aria2c") if self.config.use_aria2c else None
+        if self.aria2c and self.config.max_rps:
+            # aria2c has no per-host request rate limit, so honour max_rps with the built-in downloader
+            logger.warning("max_rps is set; not using aria2c")
+            self.aria2c = None
+        self._mkdir_cache = set()  # Directories already known to exist
+        # Earliest time the next post may start when inter_post_delay is set, shared by all workers
+        self._next_post_start = 0.0
+        self._pace_lock = threading.Lock()
+        # One pool for the lifetime of the downloader, shared by every post
+        self.executor = ThreadPoolExecutor(max_workers=self.config.download_workers)
+        # Range segments get their own pool: waiting on them from a download worker must not deadlock
+        self.segment_executor = ThreadPoolExecutor(max_workers=self.SEGMENTS * 2)
+
+    def reset_database(self):
+        """
+        Delete the downloaded-posts database, including its WAL side files, and start a fresh one.
+        """
+        with self.db_lock:
+            self._pending.clear()
+            self._known.clear()
+            self._mkdir_cache.clear()  # Folders are often deleted along with the database
+            self.db.close()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.db.database + suffix):
+                    os.remove(self.db.database + suffix)
+            self.db.connect()
+            self.db.create_tables([self.model])
+
+    def migrate_database(self):
+        """
+        Move a database created with the old (id, value UNIQUE) layout to the value-keyed table, once.
+        """
+        table = self.model._meta.table_name
+        if 'id' not in [column.name for column in self.db.get_columns(table)]:
+            return
+        # One transaction, so an interrupted migration leaves the old table untouched
+        with self.db.atomic():
+            self.db.execute_sql(f'ALTER TABLE "{table}" RENAME TO "{table}_old"')
+            self.db.create_tables([self.model])
+            self.db.execute_sql(f'INSERT OR IGNORE INTO "{table}" (value) SELECT value FROM "{table}_old"')
+            self.db.execute_sql(f'DROP TABLE "{table}_old"')
+
+    def close(self):
+        """
+        Write pending database rows, stop the download pool and release connections.
+        """
+        self.flush()
+        self.executor.shutdown(wait=True)
+        self.segment_executor.shutdown(wait=True)
+        self.session.close()
+        self.db.close()
+
+    def makedirs(self, path: str):
+        """
+        Create a directory tree once; later calls for the same path skip the filesystem.
+        """
+        if path not in self._mkdir_cache:
+            # Post folders are new children of an existing folder, so one mkdir usually suffices;
+            # makedirs would stat the parent first
+            try:
+                os.mkdir(path)
+            except FileExistsError:
+                pass
+            except FileNotFoundError:
+                os.makedirs(path, exist_ok=True)
+            self._mkdir_cache.add(path)
 
     def create_model(self):
         """
         Define the SQLite model for tracking downloaded posts.
         """
         class DownloadedPosts(Model):
-            value = CharField(unique=True)  # Unique identifier for downloaded posts
+            value = CharField(primary_key=True)  # Unique identifier for downloaded posts
 
             class Meta:
                 database = self.db  # Link the model to the SQLite database
+                # The post ID is the key, so there is no rowid table plus a separate unique index
+                without_rowid = True
 
         return DownloadedPosts
 
     @staticmethod
+    @lru_cache(maxsize=4096)  # Names repeat across posts (covers, banners) and across runs in one session
     def sanitize_filename(filename: str) -> str:
         """
         Sanitize a filename by removing invalid characters and replacing spaces with underscores.
         """
-        filename = re.sub(r'[\\/*?\"<>|]', '', filename)  # Remove invalid characters
-        return filename.replace(' ', '_')
+        return filename.translate(_FILENAME_TRANS)
 
     def download_file(self, file_url: str, save_path: str):
         """
         Download a file from a URL and save it to the specified path.
-        Includes retry logic and a progress bar.
+        Connection errors and 5xx responses are retried by the session adapter;
+        this loop only retries transfers that break off mid-stream, and raises once it gives up.
+        Data is written to save_path + '.part' and renamed on completion, so an existing
+        save_path is always a finished file.
         """
-        max_retries = 5
+        if os.path.exists(save_path):
+            logger.debug(i18n.t("download_success", file_url=file_url, downloaded_size=os.path.getsize(save_path)))
+            return
+
+        part_path = save_path + ".part"
+        max_retries = 3
         retry_delay = 5  # Delay in seconds between retries
         attempt = 0
 
         while attempt < max_retries:
             try:
-                print(i18n.t("download_attempt", text1=attempt + 1, text2=file_url), flush=True)
-                response = requests.get(file_url, stream=True, proxies=self.config.get_requests_proxy(),
-                                        verify=self.config.debug_verify_ssl)
+                logger.debug(i18n.t("download_attempt", text1=attempt + 1, text2=file_url))
+
+                # Resume from whatever a previous attempt or run of this download left in the .part file
+                have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                headers = {"Range": f"bytes={have}-", "Accept-Encoding": "identity"} if have else None
+                response = self.session.get(file_url, stream=True, headers=headers,
+                                            proxies=self.config.get_requests_proxy(),
+                                            verify=self.config.debug_verify_ssl)
+
+                if response.status_code == 416:
+                    # Nothing left past our offset: either the file is complete or it is longer than the original
+                    response.close()
+                    if response.headers.get('content-range', '').endswith(f"/{have}"):
+                        os.replace(part_path, save_path)
+                        logger.debug(i18n.t("download_success", file_url=file_url, downloaded_size=have))
+                        return
+                    os.remove(part_path)
+                    raise Exception(i18n.t("could_not_complete"))
                 response.raise_for_status()
 
-                # Get the total file size from headers
-                total_size = int(response.headers.get('content-length', 0))
-
-                # Save the file with a progress bar
-                with open(save_path, 'wb') as f:
-                    with tqdm(
-                        total=total_size, unit='B', unit_scale=True, unit_divisor=1024,
-                        desc="Downloading", leave=False
-                    ) as pbar:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-                                pbar.update(len(chunk))
-
-                downloaded_size = os.path.getsize(save_path)
-                if downloaded_size == total_size:
-                    print(i18n.t("download_success", file_url=file_url, downloaded_size=downloaded_size))
+                if response.status_code == 206:
+                    # Content-Range: bytes <start>-<end>/<total>
+                    total_size = int(response.headers['content-range'].rsplit('/', 1)[1])
+                    mode = 'ab'
+                else:
+                    # Server ignored the range (or there was nothing to resume): start over
+                    total_size = int(response.headers.get('content-length', 0))
+                    mode = 'wb'
+                    if (attempt == 0 and total_size >= self.SEGMENT_THRESHOLD
+                            and response.headers.get('accept-ranges', '').lower() == 'bytes'
+                            and 'content-encoding' not in response.headers):
+                        # Large fresh download: drop this stream and fetch the file as parallel ranges.
+                        # Only on the first attempt, so retries fall back to a single resumable stream.
+                        response.close()
+                        self.download_segments(file_url, save_path, total_size)
+                        logger.debug(i18n.t("download_success", file_url=file_url, downloaded_size=total_size))
+                        return
+
+                # Progress is reported per post by run_download_script, not per file
+                with open(part_path, mode) as f:
+                    # Copy straight from the socket in 1 MiB blocks, skipping iter_content's generator layer
+                    response.raw.decode_content = True
+                    shutil.copyfileobj(response.raw, f, length=1 << 20)
+                    downloaded_size = f.tell()  # Includes any resumed prefix when appending
+
+                # A missing Content-Length (0) can't be checked, so only a known size can be "incomplete"
+                if not total_size or downloaded_size == total_size:
+                    os.replace(part_path, save_path)
+                    logger.debug(i18n.t("download_success", file_url=file_url, downloaded_size=downloaded_size))
                 else:
-                    print(i18n.t("download_incomplete", file_url=file_url, total_size=total_size, downloaded_size=downloaded_size))
+                    logger.warning(i18n.t("download_incomplete", file_url=file_url, total_size=total_size, downloaded_size=downloaded_size))
                     raise Exception(i18n.t("could_not_complete"))
 
-                print(i18n.t("download_complete", file_url=file_url), flush=True)
                 return  # Exit if the download is successful
 
             except Exception as e:
                 attempt += 1
-                print(f"Warning: Attempt {attempt} failed for {file_url}: {e}")
+                logger.warning(f"Attempt {attempt} failed for {file_url}: {e}")
                 if attempt < max_retries:
-                    print(f"Retrying in {retry_delay} seconds...")
+                    logger.warning(f"Retrying in {retry_delay} seconds...")
                     time.sleep(retry_delay)
                 else:
-                    print(f"Download failed after {max_retries} attempts.")
-                    return
+                    logger.error(f"Download failed after {max_retries} attempts.")
+                    raise  # Fail the post so it is not recorded as downloaded
+
+    def download_segments(self, file_url: str, save_path: str, total_size: int):
+        """
+        Download a file as SEGMENTS concurrent byte ranges written into a preallocated
+        .segments file, which replaces save_path only once every range has completed.
+        Failed ranges are retried on their own; if they keep failing, the completed
+        prefix becomes the .part file so the single-stream retry resumes from it.
+        """
+        # Not the .part name: a preallocated file with holes must never be resumed as a prefix
+        segments_path = save_path + ".segments"
+        with open(segments_path, 'wb') as f:
+            f.truncate(total_size)
+
+        bounds = [total_size * i // self.SEGMENTS for i in range(self.SEGMENTS + 1)]
+        pending = list(zip(bounds, bounds[1:]))
+        for _ in range(3):
+            futures = {self.segment_executor.submit(self.download_range, file_url, segments_path, start, end): (start, end)
+                       for start, end in pending}
+            wait(futures)
+            failed = {future: futures[future] for future in futures if future.exception()}
+            if not failed:
+                os.replace(segments_path, save_path)
+                return
+            pending = sorted(failed.values())  # Finished ranges are kept, only these are fetched again
+            logger.warning(f"{len(pending)} of {self.SEGMENTS} ranges failed for {file_url}: "
+                           f"{next(iter(failed)).exception()}")
+
+        # Everything below the first failed range is complete; beyond it the file may have holes
+        prefix = pending[0][0]
+        if prefix:
+            with open(segments_path, 'r+b') as f:
+                f.truncate(prefix)
+            os.replace(segments_path, save_path + ".part")
+        else:
+            os.remove(segments_path)
+        raise Exception(i18n.t("could_not_complete"))
+
+    def download_range(self, file_url: str, part_path: str, start: int, end: int):
+        """
+        Download bytes [start, end) of a file into the same offsets of part_path.
+        """
+        headers = {"Range": f"bytes={start}-{end - 1}", "Accept-Encoding": "identity"}
+        with self.session.get(file_url, stream=True, headers=headers,
+                              proxies=self.config.get_requests_proxy(),
+                              verify=self.config.debug_verify_ssl) as response:
+            if response.status_code != 206:
+                raise Exception(i18n.t("could_not_complete"))
+            with open(part_path, 'r+b') as f:
+                f.seek(start)
+                shutil.copyfileobj(response.raw, f, length=1 << 20)
+                if f.tell() != end:
+                    raise Exception(i18n.t("could_not_complete"))
+
+    def download_with_aria2c(self, downloads: List) -> set:
+        """
+        Hand a batch of (url, save_path) pairs to one aria2c run, which transfers them
+        concurrently and splits large files into parallel ranged connections.
+        Return the save paths that did not complete.
+        """
+        # The input file is line-based: a newline in a remote URL or path would inject aria2c options
+        unsafe = {save_path for file_url, save_path in downloads
+                  if any(c in file_url or c in save_path for c in '\r\n')}
+        for save_path in unsafe:
+            logger.error(f"{i18n.t('could_not_complete')}: {save_path!r}")
+        downloads = [(file_url, save_path) for file_url, save_path in downloads if save_path not in unsafe]
+        if not downloads:
+            return unsafe
+
+        # Per-URI options go in the input file (read from stdin), so proxy credentials never show in argv
+        proxies = self.config.get_requests_proxy()
+        uri_options = f"  all-proxy={proxies['https']}\n" if proxies else ""
+        input_file = "".join(
+            f"{file_url}\n  dir={os.path.dirname(save_path)}\n  out={os.path.basename(save_path)}\n{uri_options}"
+            for file_url, save_path in downloads
+        )
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # aria2c writes every download that failed or did not finish to the session file on exit
+            session_path = os.path.join(tmp, "session")
+            command = [
+                self.aria2c, "--input-file=-", f"--save-session={session_path}",
+                f"--max-concurrent-downloads={self.config.download_workers}",
+                "--max-connection-per-server=8", "--split=8",
+                "--continue=true", "--auto-file-renaming=false", "--allow-overwrite=true",
+                "--max-tries=5", "--retry-wait=5",
+                # Keep aria2c's readout and results table out of the stdout shared with the posts bar
+                "--quiet=true",
+            ]
+            if not self.config.debug_verify_ssl:
+                command.append("--check-certificate=false")
+
+            result = subprocess.run(command, input=input_file, text=True)
+            if result.returncode == 0:
+                return unsafe
+            if not os.path.exists(session_path):
+                raise Exception(f"aria2c exited with code {result.returncode}")
+            with open(session_path) as session:
+                return unsafe | self.parse_aria2c_session(session)
+
+    @staticmethod
+    def parse_aria2c_session(lines) -> set:
+        """
+        Return the save paths listed in an aria2c session (input-file format: a URI line
+        followed by indented option lines).
+        """
+        paths = set()
+        options = None
+
+        def add(options):
+            if options is not None and "out" in options:
+                paths.add(os.path.join(options.get("dir", ""), options["out"]))
+
+        for line in lines:
+            if not line.strip():
+                continue
+            if line[0].isspace():
+                key, _, value = line.strip().partition("=")
+                options[key] = value
+            else:
+                add(options)
+                options = {}
+        add(options)
+        return paths
 
     def process_post(self, post: dict, base_folder: str):
         """
@@ -333,16 +777,18 @@ class Down:
         """
         post_id = post.get("id")
         post_folder = os.path.join(base_folder, post_id)
-        os.makedirs(post_folder, exist_ok=True)
+        self.makedirs(post_folder)
 
-        print(f"Processing post ID {post_id}")
+        logger.debug(f"Processing post ID {post_id}")
 
-        # Download files in parallel
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            for file_url, file_save_path in self.generate_downloads(post, post_folder):
-                executor.submit(self.download_file, file_url, file_save_path)
+        # Download files in parallel on the shared pool and wait for this post's files
+        futures = [self.executor.submit(self.download_file, file_url, file_save_path)
+                   for file_url, file_save_path in self.generate_downloads(post, post_folder)]
+        wait(futures)
+        for future in futures:
+            future.result()
 
-        print(f"Post {post_id} downloaded successfully.")
+        logger.debug(f"Post {post_id} downloaded successfully.")
 
     def generate_downloads(self, post: dict, post_folder: str):
         """
@@ -356,28 +802,91 @@ class Down:
             file_save_path = os.path.join(post_folder, new_filename)
             yield file_url, file_save_path
 
+    def flush(self):
+        """
+        Write the pending downloaded post IDs to the database in a single transaction.
+        """
+        with self.db_lock:
+            if not self._pending:
+                return
+            with self.db.atomic():
+                self.model.insert_many([{'value': v} for v in self._pending]).on_conflict_ignore().execute()
+            self._pending.clear()
+
+    def mark_downloaded(self, post_id: str):
+        """
+        Record a post as downloaded; rows are written in batches by flush().
+        """
+        with self.db_lock:
+            self._pending.append(post_id)
+            self._known.add(post_id)
+            flush_now = len(self._pending) >= self.FLUSH_EVERY
+        if flush_now:
+            self.flush()
+
+    def run_aria2c_batch(self, base_folder: str, posts: List[Dict]) -> List[Dict]:
+        """
+        Download a batch of posts with a single aria2c run and record the ones whose
+        files all completed. Return the posts that did not.
+        """
+        base_folder = os.path.join(base_folder, "posts")
+        self.makedirs(base_folder)
+
+        downloads = {}
+        for post in posts:
+            post_folder = os.path.join(base_folder, post["id"])
+            self.makedirs(post_folder)
+            downloads[post["id"]] = list(self.generate_downloads(post, post_folder))
+
+        # Same .part convention as download_file: aria2c resumes the .part, and only finished files are renamed
+        pending = [(file_url, save_path) for file_url, save_path in chain.from_iterable(downloads.values())
+                   if not os.path.exists(save_path)]
+        unfinished_parts = self.download_with_aria2c([(file_url, save_path + ".part") for file_url, save_path in pending])
+        unfinished = set()
+        for _, save_path in pending:
+            part_path = save_path + ".part"
+            if part_path in unfinished_parts or not os.path.exists(part_path):
+                unfinished.add(save_path)
+            else:
+                os.replace(part_path, save_path)
+
+        failed = []
+        for post in posts:
+            if any(save_path in unfinished for _, save_path in downloads[post["id"]]):
+                failed.append(post)
+            else:
+                self.mark_downloaded(post["id"])
+        return failed
+
+    def downloaded_ids(self, post_ids: List[str]) -> set:
+        """
+        Return which of the given post IDs are already recorded as downloaded.
+        """
+        with self.db_lock:
+            return self._known.intersection(post_ids)
+
     def run(self, base_folder: str, post_json: dict):
         """
         Run the download process for a single post.
         """
         # Set up the base folder for saving posts
         base_folder = os.path.join(base_folder, "posts")
-        os.makedirs(base_folder, exist_ok=True)
-
-        # Check if the post has already been downloaded
-        try:
-            self.model.get(self.model.value == post_json.get("id"))
-            print(i18n.t("already_downloaded"))
-            return
-        except self.model.DoesNotExist:
-            print(i18n.t("starting_download"))
-
+        self.makedirs(base_folder)
+
+        # Optional spacing for users who want to be gentler than max_rps; 429s are retried by the session.
+        # Post starts are spaced across all workers, so this is a real gap between posts.
+        if self.config.inter_post_delay > 0:
+            with self._pace_lock:
+                now = time.monotonic()
+                start = max(now, self._next_post_start)
+                self._next_post_start = start + self.config.inter_post_delay
+            time.sleep(start - now)
+
+        # Already-downloaded posts are filtered out by the caller through downloaded_ids()
         # Process and download the post
         self.process_post(post_json, base_folder)
 
-        # Mark the post as downloaded
-        self.model.create(value=post_json.get("id"))
-        time.sleep(2)  # Pause between posts to avoid overloading the server
+        self.mark_downloaded(post_json.get("id"))
 
 
 class Downloader:
@@ -420,28 +929,30 @@ class Downloader:
             # Sort posts based on configuration
             json_posts = sorted(json_posts, key=lambda x: x['id'], reverse=self.config.process_from_oldest)
 
+            # Skip posts that were already downloaded with a single lookup instead of one per post
+            done = self.down.downloaded_ids([post['id'] for post in json_posts])
+            if done:
+                print(f"{i18n.t('already_downloaded')}: {len(done)}")
+                json_posts = [post for post in json_posts if post['id'] not in done]
+
             # Normalize base folder for posts
             posts_folder = str(os.path.join(base_dir, service, f"{username} - {user_id}"))
 
-            for post in json_posts:
-                post_folder = os.path.join(posts_folder, "posts", post['id'])
-                expected_files_count = len(post['files'])
-
-                try:
-                    self.down.run(posts_folder, post)
-                    current_files_count = len([
-                        f for f in os.listdir(post_folder)
-                        if os.path.isfile(os.path.join(post_folder, f))
-                    ])
-
-                    if current_files_count == expected_files_count:
-                        print(i18n.t("post_downloaded", post_id=post['id'], current_files_count=current_files_count, expected_files_count=expected_files_count))
+            # Keep several posts in flight so the shared file pool stays busy on small posts.
+            # Actual HTTP concurrency is still bounded by Down's pool, not multiplied by this one.
+            # On Ctrl-C, map()'s iterator cancels the queued posts; the ones in progress finish,
+            # and the finally records them before the interrupt propagates.
+            try:
+                with logging_redirect_tqdm(), tqdm(total=len(json_posts), unit='post') as pbar:
+                    if self.down.aria2c:
+                        # aria2c runs its own transfer queue, so feed it whole batches of posts
+                        for i in range(0, len(json_posts), Down.ARIA2C_BATCH):
+                            self._process_batch(json_posts[i:i + Down.ARIA2C_BATCH], posts_folder, pbar)
                     else:
-                        print(i18n.t("post_partially_downloaded", post_id=post['id'], current_files_count=current_files_count, expected_files_count=expected_files_count))
-
-                except Exception as e:
-                    print(f"{i18n.t('post_download_error', post_id=post['id'])}: {e}")
-                    time.sleep(0.5)
+                        with ThreadPoolExecutor(max_workers=min(16, (os.cpu_count() or 1) * 2)) as executor:
+                            list(executor.map(lambda p: self._process_one(p, posts_folder, pbar), json_posts))
+            finally:
+                self.down.flush()
 
             print(i18n.t("post_all_complete"))
 
@@ -449,6 +960,58 @@ class Downloader:
             print(f"Unexpected error: {e}")
             raise
 
+    def _process_one(self, post: dict, posts_folder: str, pbar: tqdm):
+        """
+        Download a single post and report how many of its files made it to disk.
+        """
+        try:
+            self.down.run(posts_folder, post)
+            self._report_files(post, posts_folder)
+
+        except Exception as e:
+            logger.error(f"{i18n.t('post_download_error', post_id=post['id'])}: {e}")
+            time.sleep(0.5)
+
+        finally:
+            pbar.set_postfix(id=post['id'], refresh=False)
+            pbar.update(1)
+
+    def _process_batch(self, posts: List[Dict], posts_folder: str, pbar: tqdm):
+        """
+        Download a batch of posts with one aria2c run and report each post like _process_one.
+        """
+        try:
+            failed = {post['id'] for post in self.down.run_aria2c_batch(posts_folder, posts)}
+            error = i18n.t("could_not_complete")
+        except Exception as e:
+            failed = {post['id'] for post in posts}
+            error = e
+
+        for post in posts:
+            if post['id'] in failed:
+                logger.error(f"{i18n.t('post_download_error', post_id=post['id'])}: {error}")
+            else:
+                self._report_files(post, posts_folder)
+
+        pbar.set_postfix(id=posts[-1]['id'], refresh=False)
+        pbar.update(len(posts))
+
+    @staticmethod
+    def _report_files(post: dict, posts_folder: str):
+        """
+        Log how many of a downloaded post's files made it to disk.
+        """
+        post_folder = os.path.join(posts_folder, "posts", post['id'])
+        expected_files_count = len(post['files'])
+        # scandir's DirEntry carries the file type, so no extra stat per file
+        with os.scandir(post_folder) as entries:
+            current_files_count = sum(1 for entry in entries if entry.is_file())
+
+        if current_files_count == expected_files_count:
+            logger.info(i18n.t("post_downloaded", post_id=post['id'], current_files_count=current_files_count, expected_files_count=expected_files_count))
+        else:
+            logger.warning(i18n.t("post_partially_downloaded", post_id=post['id'], current_files_count=current_files_count, expected_files_count=expected_files_count))
+
     def download_profile_posts(self):
         """
         Download posts from a profile.
@@ -495,12 +1058,15 @@ class Downloader:
         """
         Customize application settings via an interactive menu.
         """
-        config = Config.from_yaml("conf.yaml")
+        # Edit the live config shared with Posts and Down, so changes apply without reloading;
+        # save_to_yaml writes through to the config cache, so nothing is re-parsed either
+        config = self.config
 
         while True:
             self.display_logo()
-            print(i18n.t("customize_settings", get_empty_posts=self.config.get_empty_posts, process_from_oldest=self.config.process_from_oldest, save_info=self.config.save_info, post_info=self.config.post_info))
+            print(i18n.t("customize_settings", get_empty_posts=config.get_empty_posts, process_from_oldest=config.process_from_oldest, save_info=config.save_info, post_info=config.post_info))
             choice = input(i18n.t("download_profile_posts_choice"))
+            before = asdict(config)
 
             if choice == '1':
                 config.get_empty_posts = not config.get_empty_posts
@@ -515,8 +1081,10 @@ class Downloader:
             else:
                 print(i18n.t("invalid_option_try_again"))
 
-            config.save_to_yaml("conf.yaml")
-            print("\nUpdated configurations.")
+            # Only rewrite conf.yaml when the choice actually changed a setting
+            if asdict(config) != before:
+                config.save_to_yaml("conf.yaml")
+                print("\nUpdated configurations.")
             time.sleep(1)
 
     def main_menu(self):
@@ -533,13 +1101,16 @@ class Downloader:
             elif choice == '2':
                 self.customize_settings()
             elif choice == '3':
-                os.remove("downloaded.db")
+                self.down.reset_database()
             elif choice == '4':
                 print(i18n.t("leave_program"))
+                self.posts.close()
+                self.down.close()
                 break
             else:
                 print(i18n.t("invalid_option"))
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
     Downloader().main_menu()